@@ -1,10 +1,4 @@
-import sys, os
-# Backwards-compatible wrapper for migrated GUI
-root = os.path.dirname(__file__)
-src = os.path.join(root, 'src')
-if src not in sys.path:
-    sys.path.insert(0, src)
-
+# Backwards-compatible wrapper for migrated GUI (requires `pip install -e .`)
 from mdt.gui import main
 
 if __name__ == '__main__':
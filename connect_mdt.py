@@ -1,9 +1,5 @@
-import sys, os
-root = os.path.dirname(__file__)
-src = os.path.join(root, 'src')
-if src not in sys.path:
-    sys.path.insert(0, src)
+# Backwards-compatible wrapper for the connection CLI (requires `pip install -e .`)
+from mdt.utils import main
 
-from mdt.utils import *
-
-__all__ = getattr(sys.modules.get('mdt.utils'), '__all__', [])
+if __name__ == '__main__':
+    main()
@@ -19,22 +19,126 @@ from __future__ import annotations
 import argparse
 import hashlib
 import os
+import re
+import shutil
 import sys
+from typing import Optional
+from urllib.error import HTTPError
 from urllib.request import urlopen, Request
 
 
-def download_file(url: str, dest: str) -> None:
-    req = Request(url, headers={"User-Agent": "mdt-helper/1.0"})
-    with urlopen(req) as r, open(dest, "wb") as fh:
-        fh.write(r.read())
+CHUNK_SIZE = 1024 * 1024
+# sidecar recording the URL and validator a partial download belongs to
+META_SUFFIX = ".meta"
 
 
-def sha256_file(path: str) -> str:
-    h = hashlib.sha256()
-    with open(path, "rb") as fh:
-        for chunk in iter(lambda: fh.read(8192), b""):
-            h.update(chunk)
-    return h.hexdigest()
+def _resume_validator(r) -> Optional[str]:
+    """Return a validator usable with If-Range (strong ETag or Last-Modified)."""
+    etag = r.headers.get("ETag")
+    if etag and not etag.startswith("W/"):
+        return etag
+    return r.headers.get("Last-Modified")
+
+
+def _read_meta(meta: str, url: str) -> Optional[str]:
+    """Return the saved validator if `meta` records a partial of `url`."""
+    try:
+        with open(meta, encoding="utf-8") as fh:
+            saved_url, validator = fh.read().splitlines()[:2]
+    except (OSError, ValueError):
+        return None
+    return validator if saved_url == url and validator else None
+
+
+def _remove_partial(path: str) -> None:
+    for fn in (path, path + META_SUFFIX):
+        try:
+            os.remove(fn)
+        except OSError:
+            pass
+
+
+def _open_download(url: str, offset: int, validator: Optional[str] = None):
+    """Open `url`, asking for bytes from `offset` onward when resuming.
+
+    The range is sent with If-Range so a changed resource comes back whole.
+    Returns the response and the offset it actually starts at (0 when the
+    server sends the whole file).
+    """
+    headers = {"User-Agent": "mdt-helper/1.0"}
+    if offset:
+        headers["Range"] = f"bytes={offset}-"
+        headers["If-Range"] = validator
+    try:
+        r = urlopen(Request(url, headers=headers))
+    except HTTPError as e:
+        if not offset or e.code != 416:
+            raise
+        # range not satisfiable (e.g. stale or complete partial): start over
+        return _open_download(url, 0)
+    if offset and r.getcode() == 206:
+        # only append if the server sends exactly the rest of a known-size file
+        m = re.fullmatch(r"bytes (\d+)-(\d+)/(\d+)", r.headers.get("Content-Range", "").strip())
+        if m and int(m.group(1)) == offset and int(m.group(2)) == int(m.group(3)) - 1:
+            return r, offset
+        r.close()
+        return _open_download(url, 0)
+    return r, 0
+
+
+def download_file(url: str, dest: str, hasher=None) -> None:
+    """Stream `url` to `dest`, optionally feeding each chunk to `hasher`.
+
+    `dest` should be a scratch path (see `main`, which uses `<name>.part`).
+    The URL and its ETag/Last-Modified are recorded in `dest + META_SUFFIX`;
+    an interrupted download is resumed with an HTTP Range request only when
+    that record matches, and servers that ignore or reject the range (or
+    report a changed resource) get a full re-download.
+    """
+    meta = dest + META_SUFFIX
+    validator = _read_meta(meta, url) if os.path.isfile(dest) else None
+    existing = os.path.getsize(dest) if validator else 0
+    r, offset = _open_download(url, existing, validator)
+    with r:
+        if not offset:
+            # record what this partial belongs to before writing any of it
+            validator = _resume_validator(r)
+            if validator:
+                with open(meta, "w", encoding="utf-8") as fh:
+                    fh.write(f"{url}\n{validator}\n")
+            else:
+                # nothing to check a resume against: never resume this one
+                try:
+                    os.remove(meta)
+                except OSError:
+                    pass
+        elif hasher is not None:
+            # bring the hash state up to date with the bytes already on disk
+            _update_from_file(hasher, dest)
+        length = r.headers.get("Content-Length")
+        with open(dest, "ab" if offset else "wb") as fh:
+            if hasher is None:
+                # stream to disk in 1 MiB chunks instead of buffering the whole DLL
+                shutil.copyfileobj(r, fh, length=CHUNK_SIZE)
+            else:
+                # hash while streaming so verification needs no second pass over the file
+                while chunk := r.read(CHUNK_SIZE):
+                    fh.write(chunk)
+                    hasher.update(chunk)
+            # a dropped connection ends the stream early without raising
+            if length is not None and fh.tell() != offset + int(length):
+                raise OSError(f"connection closed after {fh.tell()} of {offset + int(length)} bytes")
+
+
+def _update_from_file(h, path: str) -> None:
+    # reuse one unbuffered read buffer instead of allocating a bytes per chunk;
+    # size it to the file (64 KiB..1 MiB) so small files don't pay for 1 MiB
+    block = min(CHUNK_SIZE, max(64 * 1024, os.path.getsize(path) // 16))
+    buf = bytearray(block)
+    mv = memoryview(buf)
+    with open(path, "rb", buffering=0) as fh:
+        while n := fh.readinto(buf):
+            h.update(mv[:n])
 
 
 def main(argv=None):
@@ -54,22 +158,33 @@ def main(argv=None):
     outname = args.outname or os.path.basename(args.url)
     dest = os.path.join(outdir, outname)
 
+    # download next to the target and only move it into place once complete
+    # (and verified), so the loader never sees a partial or unverified DLL
+    part = dest + ".part"
+    hasher = hashlib.sha256() if args.sha256 else None
+
     print(f"Downloading {args.url} -> {dest} ...")
     try:
-        download_file(args.url, dest)
+        download_file(args.url, part, hasher)
     except Exception as e:
         print(f"Download failed: {e}")
+        if os.path.isfile(part):
+            print(f"Partial download kept at {part}; re-run the same command to resume.")
         return 2
 
-    if args.sha256:
-        got = sha256_file(dest)
+    if hasher is not None:
+        got = hasher.hexdigest()
         if got.lower() != args.sha256.lower():
             print(f"SHA256 mismatch: expected {args.sha256} got {got}")
+            _remove_partial(part)
             return 3
         print("SHA256 verified")
     else:
         print("Downloaded (no SHA256 provided). Consider verifying checksum manually.")
 
+    os.replace(part, dest)
+    _remove_partial(part)
+
     print("Done. DLL saved to .mdt_dlls/")
     return 0
 
@@ -13,6 +13,7 @@ serial protocol.
 Usage:
   python tools\probe_mdt.py           # print human-readable results
   python tools\probe_mdt.py --json out.json  # save JSON results to file
+  python tools\probe_mdt.py --ndjson         # stream one JSON line per port
 
 Requires: pyserial (serial, serial.tools.list_ports)
 """
@@ -22,8 +23,11 @@ import argparse
 import json
 import re
 import sys
+import threading
 import time
-from typing import Dict, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import closing
+from typing import Dict, Iterator, Optional, Tuple
 
 from serial.tools import list_ports
 
@@ -33,9 +37,42 @@ except Exception as e:
     print("Missing dependency 'pyserial'. Install with: pip install pyserial")
     raise
 
+# optional C-based JSON encoder; stdlib json is used when unavailable
+try:
+    import orjson
+except Exception:
+    orjson = None
+
 ID_COMMANDS = [b'XR?\r', b'ID?\r', b'*IDN?\r', b'XR?\n', b'XR?']
+# the CR-terminated ID commands sent back-to-back in a single write
+_COMBINED = b''.join(ID_COMMANDS[:3])
+COMBINED_READ_SIZE = 8192
+# cap for a single command's reply; MDT replies are short
+REPLY_READ_SIZE = 3072
 DEFAULT_BAUD = 115200
 DEFAULT_TIMEOUT = 0.3
+# gap in the reply stream that ends a read once the device stops sending;
+# enforced by polling in_waiting because pyserial only honours
+# inter_byte_timeout on Windows (POSIX read() waits out the full timeout)
+INTER_BYTE_TIMEOUT = 0.03
+POLL_INTERVAL = 0.005
+WRITE_TIMEOUT = 0.1
+# minimum wall-clock cap on a single port's probe, enforced with
+# cancel_read/cancel_write; raised with --timeout so slow-but-healthy ports
+# are not cut off (see _port_budget)
+PORT_BUDGET = 5.0
+PORT_BUDGET_MARGIN = 1.0
+
+# USB vendor IDs used to order or skip ports before any serial I/O.
+# MDT controllers enumerate as Thorlabs or behind Prolific/FTDI bridges.
+LIKELY_GOOD_VIDS = {0x1313, 0x067B, 0x0403}
+# Vendors whose virtual COM ports cannot be MDTs (Microsoft, Logitech, Intel BT)
+KNOWN_BAD_VIDS = {0x045E, 0x046D, 0x8087}
+
+# matched against the raw reply bytes so non-matching replies are never decoded
+_TAG_RE = re.compile(rb'MDT|THOR', re.IGNORECASE)
+_MODEL_RE = re.compile(rb'69[34]')
+_NUM_RE = re.compile(rb'-?\d+\.\d+')
 
 
 def _strip_echo_and_prompts(raw: bytes, cmd: bytes) -> str:
@@ -57,125 +94,305 @@ def _strip_echo_and_prompts(raw: bytes, cmd: bytes) -> str:
     return s
 
 
-def probe_port(port_name: str, baud: int, timeout: float) -> Dict:
+def _strip_combined_reply(raw: bytes) -> str:
+    """Decode a reply to `_COMBINED`, dropping the echo of every command."""
+    echoes = [c.strip() for c in ID_COMMANDS[:3]]
+    parts = []
+    for line in re.split(rb'[\r\n]+', raw):
+        # a prompt may precede the echoed command on the same line
+        line = line.strip(b' >')
+        for echo in echoes:
+            if line.startswith(echo):
+                line = line[len(echo):]
+                break
+        line = line.strip(b' >!*')
+        if line:
+            parts.append(line.decode('ascii', errors='ignore'))
+    return ' '.join(parts)
+
+
+def _is_match(raw: bytes) -> bool:
+    """Heuristic MDT check; a numeric voltage reply is a strong sign too."""
+    return bool(_TAG_RE.search(raw) or _MODEL_RE.search(raw) or _NUM_RE.search(raw))
+
+
+def _read_until_idle(ser, size: int) -> bytes:
+    """Read up to `size` bytes, stopping once the line goes idle.
+
+    Returns after INTER_BYTE_TIMEOUT without new bytes once a reply has
+    started, or after the port's `timeout` if nothing arrives at all.
+    """
+    buf = bytearray()
+    deadline = time.monotonic() + ser.timeout
+    last_rx = None
+    while len(buf) < size:
+        waiting = ser.in_waiting
+        now = time.monotonic()
+        if waiting:
+            buf += ser.read(min(waiting, size - len(buf)))
+            last_rx = now
+        elif last_rx is not None and now - last_rx >= INTER_BYTE_TIMEOUT:
+            break
+        elif now >= deadline:
+            break
+        else:
+            time.sleep(POLL_INTERVAL)
+    return bytes(buf)
+
+
+def _read_reply(ser, cmd: bytes) -> bytes:
+    """Read the reply to `cmd` until the line goes idle.
+
+    Devices in echo mode (the MDT693A default) may send the echoed command
+    before the reply; if only the echo arrived, read again so the reply is
+    not left in the buffer for the next command.
+    """
+    raw = _read_until_idle(ser, REPLY_READ_SIZE)
+    if raw and raw.strip(b'\r\n >!*') == cmd.strip():
+        raw += _read_until_idle(ser, REPLY_READ_SIZE)
+    return raw
+
+
+def _port_budget(timeout: float) -> float:
+    """Wall-clock cap for one probe, above the worst case of a silent port."""
+    # the combined read plus up to two reads (echo, then reply) per command
+    reads = 2 * len(ID_COMMANDS) + 1
+    return max(PORT_BUDGET, reads * (timeout + WRITE_TIMEOUT) + PORT_BUDGET_MARGIN)
+
+
+def _dumps(obj, pretty: bool) -> bytes:
+    """Serialize `obj` to UTF-8 JSON bytes, using orjson when installed."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if pretty else 0)
+    return json.dumps(obj, indent=2 if pretty else None, ensure_ascii=False).encode('utf-8')
+
+
+def _is_known_unrelated(pinfo) -> bool:
+    """Return True if the port's USB descriptor rules out an MDT."""
+    if getattr(pinfo, 'vid', None) in KNOWN_BAD_VIDS:
+        return True
+    # Bluetooth serial links show up as virtual COM ports on Windows
+    hwid = str(getattr(pinfo, 'hwid', '') or '').upper()
+    return hwid.startswith('BTHENUM')
+
+
+def probe_port(pinfo, baud: int, timeout: float) -> Dict:
     """Probe a single COM port and return a result dict.
 
-    The result dict contains fields: open_error (if any), match (bool),
-    reply (raw/decoded reply or None), info (port product/manuf),
-    and vid/pid when available.
+    `pinfo` is the ListPortInfo from `list_ports.comports()`. The result
+    dict contains fields: open_error (if any), match (bool), reply
+    (raw/decoded reply or None), info (port product/manuf), and vid/pid
+    when available.
     """
-    res: Dict = {'port': port_name, 'match': False, 'reply': None}
-    try:
-        ports = {p.device: p for p in list_ports.comports()}
-        pinfo = ports.get(port_name)
-        if pinfo:
-            res['manufacturer'] = pinfo.manufacturer
-            res['product'] = pinfo.product
-            res['vid'] = getattr(pinfo, 'vid', None)
-            res['pid'] = getattr(pinfo, 'pid', None)
-            res['hwid'] = pinfo.hwid
-    except Exception:
-        pass
+    port_name = pinfo.device
+    res: Dict = {
+        'port': port_name,
+        'match': False,
+        'reply': None,
+        'manufacturer': pinfo.manufacturer,
+        'product': pinfo.product,
+        'vid': getattr(pinfo, 'vid', None),
+        'pid': getattr(pinfo, 'pid', None),
+        'hwid': pinfo.hwid,
+    }
 
+    if _is_known_unrelated(pinfo):
+        res['skipped'] = True
+        return res
+
+    # configure everything before open() so the port is set up in one pass;
+    # write_timeout bounds writes to a wedged adapter
+    ser = serial.Serial()
+    ser.port = port_name
+    ser.baudrate = baud
+    ser.timeout = timeout
+    ser.write_timeout = WRITE_TIMEOUT
+    ser.rtscts = False
+    ser.dsrdtr = False
     try:
-        ser = serial.Serial(port=port_name, baudrate=baud, timeout=timeout)
+        ser.open()
     except Exception as e:
         res['open_error'] = str(e)
         return res
 
-    try:
-        ser.reset_input_buffer()
-        ser.reset_output_buffer()
-    except Exception:
-        pass
-
     best_reply: Optional[str] = None
 
-    for cmd in ID_COMMANDS:
+    # bound the whole probe: some USB-serial drivers ignore the read timeout
+    timed_out = threading.Event()
+
+    def _cancel():
+        timed_out.set()
         try:
-            ser.write(cmd)
+            ser.cancel_read()
         except Exception:
-            continue
-        # short pause to give device time to reply
-        time.sleep(0.05)
+            pass
         try:
-            raw = ser.read(1024)
+            ser.cancel_write()
         except Exception:
-            raw = b''
+            pass
+
+    timer = threading.Timer(_port_budget(timeout), _cancel)
+    timer.daemon = True
+
+    with closing(ser):
+        timer.start()
+        try:
+            try:
+                ser.reset_input_buffer()
+                ser.reset_output_buffer()
+            except Exception:
+                pass
 
-        if not raw:
-            # try a slightly longer read to catch slower devices
+            # one round-trip for the common case: send the ID commands together
+            # and read until the interleaved replies go idle
             try:
-                raw = ser.read(2048)
+                ser.write(_COMBINED)
+                raw = _read_until_idle(ser, COMBINED_READ_SIZE)
             except Exception:
                 raw = b''
+            if raw:
+                if _is_match(raw):
+                    res['match'] = True
+                    res['reply'] = _strip_combined_reply(raw)
+                    return res
+                best_reply = _strip_combined_reply(raw) or None
 
-        decoded = _strip_echo_and_prompts(raw, cmd)
-        if decoded:
-            # heuristic checks
-            u = decoded.upper()
-            if 'MDT' in u or 'THOR' in u or re.search(r'69[34]', u):
-                res['match'] = True
-                res['reply'] = decoded
-                ser.close()
-                return res
-            if re.search(r'-?\d+\.\d+', decoded):
-                # numeric voltage reply is a strong sign
-                res['match'] = True
-                res['reply'] = decoded
-                ser.close()
-                return res
-            # keep something for human inspection
-            best_reply = decoded
+            # some devices choke on concatenated commands; retry one at a time
+            try:
+                ser.reset_input_buffer()
+            except Exception:
+                pass
 
-    try:
-        ser.close()
-    except Exception:
-        pass
+            for cmd in ID_COMMANDS:
+                if timed_out.is_set():
+                    break
+                try:
+                    ser.write(cmd)
+                except Exception:
+                    continue
+                try:
+                    raw = _read_reply(ser, cmd)
+                except Exception:
+                    raw = b''
+
+                if not raw:
+                    continue
+
+                if _is_match(raw):
+                    res['match'] = True
+                    res['reply'] = _strip_echo_and_prompts(raw, cmd)
+                    return res
+
+                # keep something for human inspection
+                decoded = _strip_echo_and_prompts(raw, cmd)
+                if decoded:
+                    best_reply = decoded
+        finally:
+            timer.cancel()
+            if timed_out.is_set():
+                res['timed_out'] = True
 
     if best_reply:
         res['reply'] = best_reply
     return res
 
 
-def scan_ports(baud: int, timeout: float) -> Dict[str, Dict]:
-    ports = list_ports.comports()
-    results: Dict[str, Dict] = {}
+def iter_scan(baud: int, timeout: float, ports=None) -> Iterator[Dict]:
+    """Probe ports concurrently, yielding each result dict as it completes."""
+    if ports is None:
+        ports = list_ports.comports()
+    if not ports:
+        return
+    # probing is I/O-bound (pyserial releases the GIL while blocked), so
+    # ports are probed concurrently and wall time approaches a single port's.
+    # Likely MDT bridges go first so they are not queued behind other ports.
+    ordered = sorted(ports, key=lambda p: getattr(p, 'vid', None) not in LIKELY_GOOD_VIDS)
+    with ThreadPoolExecutor(max_workers=min(32, len(ports))) as ex:
+        futs = {ex.submit(probe_port, p, baud, timeout): p.device for p in ordered}
+        for fut in as_completed(futs):
+            # drop our reference so finished futures (and their results)
+            # are not retained until the whole pool finishes
+            name = futs.pop(fut)
+            try:
+                info = fut.result()
+            except Exception as e:
+                info = {'port': name, 'match': False, 'reply': None, 'error': str(e)}
+            yield info
+
+
+def _in_port_order(results: Dict[str, Dict], ports) -> Dict[str, Dict]:
+    """Reorder `results` in place to enumeration order for stable output."""
     for p in ports:
-        name = p.device
-        results[name] = probe_port(name, baud, timeout)
+        if p.device in results:
+            results[p.device] = results.pop(p.device)
     return results
 
 
+def scan_ports(baud: int, timeout: float) -> Dict[str, Dict]:
+    ports = list_ports.comports()
+    results = {info['port']: info for info in iter_scan(baud, timeout, ports)}
+    return _in_port_order(results, ports)
+
+
+def _summary_line(port: str, info: Dict) -> str:
+    if info.get('match'):
+        status = 'MATCH'
+    elif info.get('skipped'):
+        status = 'skipped'
+    elif info.get('timed_out'):
+        status = 'timeout'
+    else:
+        status = 'no'
+    reply = info.get('reply') or ''
+    manuf = info.get('manufacturer') or ''
+    product = info.get('product') or ''
+    return f"{port}: match={status} manuf={manuf} product={product} reply={reply}"
+
+
 def main(argv=None):
     p = argparse.ArgumentParser(description='Probe COM ports for Thorlabs MDT devices')
     p.add_argument('--baud', '-b', type=int, default=DEFAULT_BAUD, help='baud rate (default 115200)')
     p.add_argument('--timeout', '-t', type=float, default=DEFAULT_TIMEOUT, help='read timeout seconds')
     p.add_argument('--json', '-j', nargs='?', const='mdt_devices.json', help='write results to JSON file (optional filename)')
     p.add_argument('--pretty', action='store_true', help='pretty-print JSON when using --json')
+    p.add_argument('--ndjson', nargs='?', const='-', help='stream one JSON line per port as probes finish (to file, or stdout by default)')
     args = p.parse_args(argv)
 
-    results = scan_ports(args.baud, args.timeout)
+    to_stdout = args.ndjson == '-'
+    # keep stdout clean for piping when it carries the NDJSON stream
+    status = sys.stderr if to_stdout else sys.stdout
 
-    # print summary
-    for port, info in results.items():
-        status = 'MATCH' if info.get('match') else 'no'
-        reply = info.get('reply') or ''
-        manuf = info.get('manufacturer') or ''
-        product = info.get('product') or ''
-        print(f"{port}: match={status} manuf={manuf} product={product} reply={reply}")
+    if args.ndjson:
+        ports = list_ports.comports()
+        results: Optional[Dict[str, Dict]] = {} if args.json else None
+        out = sys.stdout.buffer if to_stdout else open(args.ndjson, 'wb')
+        try:
+            for info in iter_scan(args.baud, args.timeout, ports):
+                out.write(_dumps(info, False) + b'\n')
+                out.flush()
+                if not to_stdout:
+                    print(_summary_line(info['port'], info))
+                if results is not None:
+                    results[info['port']] = info
+        finally:
+            if not to_stdout:
+                out.close()
+        if results is not None:
+            _in_port_order(results, ports)
+    else:
+        results = scan_ports(args.baud, args.timeout)
+        # print summary
+        for port, info in results.items():
+            print(_summary_line(port, info))
 
     if args.json:
         fn = args.json if isinstance(args.json, str) and args.json != 'True' else 'mdt_devices.json'
         try:
-            with open(fn, 'w', encoding='utf-8') as fh:
-                if args.pretty:
-                    json.dump(results, fh, indent=2, ensure_ascii=False)
-                else:
-                    json.dump(results, fh, ensure_ascii=False)
-            print(f"Saved {len(results)} entries to JSON: {fn}")
+            with open(fn, 'wb') as fh:
+                fh.write(_dumps(results, args.pretty))
+            print(f"Saved {len(results)} entries to JSON: {fn}", file=status)
         except Exception as e:
-            print(f"Failed to write JSON: {e}")
+            print(f"Failed to write JSON: {e}", file=status)
 
 
 if __name__ == '__main__':